@@ -3,36 +3,79 @@ Implements base model class for deep convolutional adversarial network
 """
 
 
+import os
+import warnings
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+# cuDNN autotune and tensor op math must be configured before tensorflow loads
+os.environ.setdefault('TF_CUDNN_USE_AUTOTUNE', '1')
+os.environ.setdefault('TF_ENABLE_CUBLAS_TENSOR_OP_MATH_FP32', '1')
+import tensorflow as tf
 import matplotlib.pyplot as plt
 from pickle import dump
-from keras.models import Model, Sequential
+from keras import mixed_precision
+from keras import backend as K
+from keras.models import Model, Sequential, clone_model
+from keras.losses import binary_crossentropy
+from keras.metrics import binary_accuracy
 from keras.optimizers import RMSprop
 from keras.layers import (Input, Conv2D, Activation, LeakyReLU, Dropout,
                             Flatten, Dense, BatchNormalization, ReLU,
                             UpSampling2D, Conv2DTranspose, Reshape)
 
+# compute conv and dense layers in float16 while keeping float32 master weights
+mixed_precision.set_global_policy('mixed_float16')
+# channels-first layout matches cuDNN's fastest conv kernels; default CPU conv
+# kernels only support channels-last, so it is only used when a GPU is present
+if tf.config.list_physical_devices('GPU'):
+    K.set_image_data_format('channels_first')
+# XLA auto-clustering for graphs outside the explicitly compiled train step
+tf.config.optimizer.set_jit(True)
 
 class DC_GAN(object):
 
     def __init__(self, name, rowNum, columnNum, channelNum):
         self.name   =   name
+        # restore mixed precision if the global policy was changed after import
+        if (mixed_precision.global_policy().name != 'mixed_float16'):
+            mixed_precision.set_global_policy('mixed_float16')
         # data formats
         self.rowNum     =   rowNum
         self.columnNum  =   columnNum
         self.channelNum =   channelNum
-        self.imageShape =   (rowNum, columnNum, channelNum)
+        self.channelsFirst = (K.image_data_format() == 'channels_first')
+        if self.channelsFirst:
+            self.imageShape =   (channelNum, rowNum, columnNum)
+        else:
+            self.imageShape =   (rowNum, columnNum, channelNum)
         # model structures
         self.discriminatorStructure =   None
         self.generatorStructure     =   None
         # compiled models
         self.discriminatorCompiled  =   None
         self.adversarialCompiled    =   None
+        # inference-only generator with batch norm folded into convolutions
+        self._generatorInference    =   None
+        self._foldPlan              =   None
+        # traced call of inference generator; avoids predict() overhead
+        self._gen_fn                =   None
+        # XLA-compiled step training discriminator and adversarial together
+        self._train_step            =   None
+        # background writer and skeleton model for saving generator checkpoints
+        self._saver                 =   None
+        self._saverSkeleton         =   None
+        # per-step (disLoss, disAcc, advLoss, advAcc) of the last training run
+        self.trainHistory           =   None
         ## model building params ##
         # default first-layer filter depth of discriminator
         DIS_DEPTH               =   64
         self.DIS_DEPTH          =   DIS_DEPTH
         self.GEN_DEPTH          =   DIS_DEPTH * 4
+        # precomputed filter numbers of discriminator and generator conv layers
+        self._dis_filters       =   tuple(
+                    self.dis_get_filter_num(self.DIS_DEPTH, i) for i in range(1, 5))
+        self._gen_filters       =   tuple(
+                    self.gen_get_filter_num(self.GEN_DEPTH, i) for i in range(1, 4))
         # default dropout; should prevent memorization
         self.DROPOUT            =   0.2
         # default kernel size
@@ -70,23 +113,24 @@ class DC_GAN(object):
         print('Saved')
         return True
 
-    def dis_get_filter_num(self, LAYER_COUNTER):
+    @staticmethod
+    def dis_get_filter_num(DIS_DEPTH, LAYER_COUNTER):
         """
         Determines number of filters to use on convolution layer assuming layer
         count starts at 1.
         """
-        return (self.DIS_DEPTH * (2 ** (LAYER_COUNTER - 1)))
+        return DIS_DEPTH << (LAYER_COUNTER - 1)
 
-    def gen_get_filter_num(self, LAYER_COUNTER):
+    @staticmethod
+    def gen_get_filter_num(GEN_DEPTH, LAYER_COUNTER):
         """
         Determines number of filters to use on transpose convolution layer
         assuming filters were generated by dis_get_filter_num() and layer count
         starts at 1.
         """
-        return int(self.GEN_DEPTH / (2 ** LAYER_COUNTER))
+        return GEN_DEPTH >> LAYER_COUNTER
 
     class ModelWarning(Warning):
-        # BUG: warning currently raises exception instead of warning
         """ Class for warnings related to model building and compiling """
         pass
 
@@ -97,7 +141,7 @@ class DC_GAN(object):
         elements. If the model has already been build, it is simply returned.
         Input has the shape of a single image as specified during object
         initialization. Convolutional layers have a filter number determined
-        by self.dis_get_filter_num(LAYER_COUNTER), use self.STRIDES strides
+        by self._dis_filters[LAYER_COUNTER - 1], use self.STRIDES strides
         for downsampling, and pad to match input shape. LeakyReLU functions
         with self.LEAKY_ALPHA alpha are used to give gradients to inactive
         units and self.DROPOUT dropout is used to prevent overfitting.
@@ -105,7 +149,8 @@ class DC_GAN(object):
         a single-node, dense layer with sigmoid activation.
         """
         if self.discriminatorStructure:
-            raise self.ModelWarning('Discriminator has already been built.')
+            warnings.warn('Discriminator has already been built.',
+                        self.ModelWarning)
             return self.discriminatorStructure
         # set up local vars for building
         INPUT_SHAPE     =   self.imageShape
@@ -115,9 +160,10 @@ class DC_GAN(object):
         LEAKY_ALPHA     =   self.LEAKY_ALPHA
         LAYER_COUNTER   =   1
         ## discriminator architecture ##
-        inputs = Input(shape=INPUT_SHAPE, name='inputs')
+        # float16 input so half-precision batches reach conv_1 without a cast
+        inputs = Input(shape=INPUT_SHAPE, dtype='float16', name='inputs')
         # first conv block
-        conv_1 = Conv2D(filters=self.dis_get_filter_num(LAYER_COUNTER),
+        conv_1 = Conv2D(filters=self._dis_filters[LAYER_COUNTER - 1],
                         kernel_size=KERNEL_SIZE,
                         strides=STRIDE,
                         input_shape=INPUT_SHAPE,
@@ -127,37 +173,37 @@ class DC_GAN(object):
         drop_1 = Dropout(rate=DROPOUT, name=f'drop_{LAYER_COUNTER}')(relu_1)
         # second conv block
         LAYER_COUNTER += 1
-        conv_2 = Conv2D(filters=self.dis_get_filter_num(LAYER_COUNTER),
+        conv_2 = Conv2D(filters=self._dis_filters[LAYER_COUNTER - 1],
                         kernel_size=KERNEL_SIZE,
                         strides=STRIDE,
-                        input_shape=INPUT_SHAPE,
                         padding='same',
                         name=f'conv_{LAYER_COUNTER}')(drop_1)
         relu_2 = LeakyReLU(LEAKY_ALPHA, name=f'relu_{LAYER_COUNTER}')(conv_2)
         drop_2 = Dropout(rate=DROPOUT, name=f'drop_{LAYER_COUNTER}')(relu_2)
         # third conv block
         LAYER_COUNTER += 1
-        conv_3 = Conv2D(filters=self.dis_get_filter_num(LAYER_COUNTER),
+        conv_3 = Conv2D(filters=self._dis_filters[LAYER_COUNTER - 1],
                         kernel_size=KERNEL_SIZE,
                         strides=STRIDE,
-                        input_shape=INPUT_SHAPE,
                         padding='same',
                         name=f'conv_{LAYER_COUNTER}')(drop_2)
         relu_3 = LeakyReLU(LEAKY_ALPHA, name=f'relu_{LAYER_COUNTER}')(conv_3)
         drop_3 = Dropout(rate=DROPOUT, name=f'drop_{LAYER_COUNTER}')(relu_3)
         # fourth conv block
         LAYER_COUNTER += 1
-        conv_4 = Conv2D(filters=self.dis_get_filter_num(LAYER_COUNTER),
+        conv_4 = Conv2D(filters=self._dis_filters[LAYER_COUNTER - 1],
                         kernel_size=KERNEL_SIZE,
                         strides=STRIDE,
-                        input_shape=INPUT_SHAPE,
                         padding='same',
                         name=f'conv_{LAYER_COUNTER}')(drop_3)
         relu_4 = LeakyReLU(LEAKY_ALPHA, name=f'relu_{LAYER_COUNTER}')(conv_4)
         drop_4 = Dropout(rate=DROPOUT, name=f'drop_{LAYER_COUNTER}')(relu_4)
         # convolutional output is flattened and passed to dense classifier
         flat = Flatten(name='flat')(drop_4)
-        outputs = Dense(units=1, activation='sigmoid', name='outputs')(flat)
+        dense_output = Dense(units=1, name='dense_output')(flat)
+        # sigmoid kept in float32 for numerically stable loss
+        outputs = Activation(activation='sigmoid', dtype='float32',
+                            name='outputs')(dense_output)
         # build sequential model
         discriminatorStructure = Model(inputs=inputs, outputs=outputs)
         if verbose:
@@ -168,69 +214,82 @@ class DC_GAN(object):
     def build_generator(self, verbose=True):
         """ Builds generator architecture without compiling model """
         if self.generatorStructure:
-            raise self.ModelWarning('Generator has already been built.')
+            warnings.warn('Generator has already been built.',
+                        self.ModelWarning)
             return self.generatorStructure
         # set up local vars for building
         LATENT_DIMS     =   self.LATENT_DIMS
         KERNEL_SIZE     =   self.KERNEL_SIZE
-        DROPOUT         =   self.DROPOUT
         NORM_MOMENTUM   =   self.NORM_MOMENTUM
         GEN_DEPTH       =   self.GEN_DEPTH
         # # TEMP: Find out if other params would be better
         GEN_DIM         =   7
-        LATENT_RESHAPE  =   (GEN_DIM, GEN_DIM, GEN_DEPTH)
+        if self.channelsFirst:
+            LATENT_RESHAPE  =   (GEN_DEPTH, GEN_DIM, GEN_DIM)
+            CHANNEL_AXIS    =   1
+        else:
+            LATENT_RESHAPE  =   (GEN_DIM, GEN_DIM, GEN_DEPTH)
+            CHANNEL_AXIS    =   -1
         LATENT_NODES    =   GEN_DIM * GEN_DIM * GEN_DEPTH
         LAYER_COUNTER   =   1
         ## generator architecture ##
         latent_inputs = Input(shape=(LATENT_DIMS,), name='latent_inputs')
-        # dense layer to adjust and norm latent space
+        # dense layer to adjust latent space
         dense_latent = Dense(units=LATENT_NODES,
                             input_dim=LATENT_DIMS,
                             name='dense_latent')(latent_inputs)
-        batch_latent = BatchNormalization(momentum=NORM_MOMENTUM,
-                                        name='batch_latent')(dense_latent)
-        relu_latent = ReLU(name='relu_latent')(batch_latent)
-        # reshape latent dims into image shape matrix
+        # reshape latent dims into image shape matrix before norming, since
+        # fused batch norm requires 4D input
         reshaped_latent = Reshape(target_shape=LATENT_RESHAPE,
-                                name='reshaped_latent')(relu_latent)
-        dropout_latent = Dropout(rate=DROPOUT,
-                                name='dropout_latent')(reshaped_latent)
+                                name='reshaped_latent')(dense_latent)
+        batch_latent = BatchNormalization(axis=CHANNEL_AXIS,
+                                        momentum=NORM_MOMENTUM,
+                                        fused=True,
+                                        name='batch_latent')(reshaped_latent)
+        relu_latent = ReLU(name='relu_latent')(batch_latent)
         # first upsampling block
-        upsample_1 = UpSampling2D(name=f'upsample_{LAYER_COUNTER}')(dropout_latent)
-        transpose_1 = Conv2DTranspose(filters=self.gen_get_filter_num(LAYER_COUNTER),
+        upsample_1 = UpSampling2D(name=f'upsample_{LAYER_COUNTER}')(relu_latent)
+        transpose_1 = Conv2DTranspose(filters=self._gen_filters[LAYER_COUNTER - 1],
                                     kernel_size=KERNEL_SIZE,
                                     padding='same',
                                     name=f'transpose_{LAYER_COUNTER}')(upsample_1)
-        batch_1 = BatchNormalization(momentum=NORM_MOMENTUM,
+        batch_1 = BatchNormalization(axis=CHANNEL_AXIS,
+                                    momentum=NORM_MOMENTUM,
+                                    fused=True,
                                     name=f'batch_{LAYER_COUNTER}')(transpose_1)
         relu_1 = ReLU(name=f'relu_{LAYER_COUNTER}')(batch_1)
         # second upsampling block
         LAYER_COUNTER += 1
         upsample_2 = UpSampling2D(name=f'upsample_{LAYER_COUNTER}')(relu_1)
-        transpose_2 = Conv2DTranspose(filters=self.gen_get_filter_num(LAYER_COUNTER),
+        transpose_2 = Conv2DTranspose(filters=self._gen_filters[LAYER_COUNTER - 1],
                                     kernel_size=KERNEL_SIZE,
                                     padding='same',
                                     name=f'transpose_{LAYER_COUNTER}')(upsample_2)
-        batch_2 = BatchNormalization(momentum=NORM_MOMENTUM,
+        batch_2 = BatchNormalization(axis=CHANNEL_AXIS,
+                                    momentum=NORM_MOMENTUM,
+                                    fused=True,
                                     name=f'batch_{LAYER_COUNTER}')(transpose_2)
         relu_2 = ReLU(name=f'relu_{LAYER_COUNTER}')(batch_2)
         # third upsampling block: no upsampling for now
         # QUESTION: Will transpose on final layers lead to artifacts in sharp images?
         LAYER_COUNTER += 1
-        transpose_3 = Conv2DTranspose(filters=self.gen_get_filter_num(LAYER_COUNTER),
+        transpose_3 = Conv2DTranspose(filters=self._gen_filters[LAYER_COUNTER - 1],
                                     kernel_size=KERNEL_SIZE,
                                     padding='same',
                                     name=f'transpose_{LAYER_COUNTER}')(relu_2)
-        batch_3 = BatchNormalization(momentum=NORM_MOMENTUM,
+        batch_3 = BatchNormalization(axis=CHANNEL_AXIS,
+                                    momentum=NORM_MOMENTUM,
+                                    fused=True,
                                     name=f'batch_{LAYER_COUNTER}')(transpose_3)
         relu_3 = ReLU(name=f'relu_{LAYER_COUNTER}')(batch_3)
         # sigmoid activation on final output to assert grayscale output
-        # in range [0, 1]
+        # in range [0, 1]; kept in float32 under mixed precision
         output_transpose = Conv2DTranspose(filters=1,
                                             kernel_size=5,
                                             padding='same',
                                             name='output_transpose')(relu_3)
-        outputs = Activation(activation='sigmoid')(output_transpose)
+        outputs = Activation(activation='sigmoid',
+                            dtype='float32')(output_transpose)
         # build sequential model
         generatorStructure = Model(inputs=latent_inputs, outputs=outputs)
         if verbose:
@@ -238,6 +297,62 @@ class DC_GAN(object):
         self.generatorStructure = generatorStructure
         return generatorStructure
 
+    def _build_folded_generator(self):
+        """
+        Builds inference-only copy of the generator for sampling discriminator
+        pretraining batches; the main loop samples the generator inside
+        self._train_step instead. Each Conv2DTranspose -> BatchNormalization
+        pair of the generator is replaced by a single Conv2DTranspose. Weights
+        are filled by self._fold_generator_weights().
+        Returns:
+            Uncompiled inference generator model.
+        """
+        layers = self.generatorStructure.layers
+        foldPlan = []
+        latent_inputs = Input(shape=(self.LATENT_DIMS,), name='latent_inputs')
+        x = latent_inputs
+        i = 1
+        while i < len(layers):
+            layer = layers[i]
+            nextLayer = layers[i + 1] if (i + 1 < len(layers)) else None
+            if (isinstance(layer, Conv2DTranspose)
+                    and isinstance(nextLayer, BatchNormalization)):
+                norm = nextLayer
+                i += 2
+            else:
+                norm = None
+                i += 1
+            clone = layer.__class__.from_config(layer.get_config())
+            x = clone(x)
+            foldPlan.append((clone, layer, norm))
+        self._generatorInference = Model(inputs=latent_inputs, outputs=x)
+        self._foldPlan = foldPlan
+        latentSpec = tf.TensorSpec([None, self.LATENT_DIMS], tf.float32)
+        # images are returned in float16 to match the training batch buffers
+        self._gen_fn = tf.function(
+                    lambda z: tf.cast(self._generatorInference(z,
+                                        training=False), tf.float16),
+                    input_signature=[latentSpec])
+        return self._generatorInference
+
+    def _fold_generator_weights(self):
+        """
+        Copies current generator weights into the inference generator, folding
+        batch norm statistics into the preceding transpose convolution as
+        W' = W * gamma / sqrt(var + eps) and
+        b' = (b - mean) * gamma / sqrt(var + eps) + beta.
+        """
+        for clone, layer, norm in self._foldPlan:
+            weights = layer.get_weights()
+            if norm:
+                kernel, bias = weights
+                gamma, beta, mean, var = norm.get_weights()
+                scale = gamma / np.sqrt(var + norm.epsilon)
+                # transpose conv kernels are (rows, cols, outChannels, inChannels)
+                weights = [kernel * scale[:, np.newaxis],
+                            ((bias - mean) * scale) + beta]
+            clone.set_weights(weights)
+
     def compile_discriminator(self, learningRate, decay, verbose=True):
         """
         Compiles discriminator model.
@@ -249,9 +364,12 @@ class DC_GAN(object):
             Compiled discriminator model.
         """
         if self.discriminatorCompiled:
-            raise self.ModelWarning('Discriminator has already been compiled.')
-            return discriminatorCompiled
-        rmsOptimizer = RMSprop(lr=learningRate, decay=decay)
+            warnings.warn('Discriminator has already been compiled.',
+                        self.ModelWarning)
+            return self.discriminatorCompiled
+        # dynamic loss scaling prevents float16 gradient underflow
+        rmsOptimizer = mixed_precision.LossScaleOptimizer(
+                                RMSprop(lr=learningRate, decay=decay))
         binaryLoss = 'binary_crossentropy'
         discriminatorModel = self.discriminatorStructure
         discriminatorModel.compile(optimizer=rmsOptimizer, loss=binaryLoss,
@@ -272,8 +390,12 @@ class DC_GAN(object):
             Compiled adversarial model.
         """
         if self.adversarialCompiled:
-            raise self.ModelWarning('Adversarial has already been compiled.')
-        rmsOptimizer = RMSprop(lr=learningRate, decay=decay)
+            warnings.warn('Adversarial has already been compiled.',
+                        self.ModelWarning)
+            return self.adversarialCompiled
+        # dynamic loss scaling prevents float16 gradient underflow
+        rmsOptimizer = mixed_precision.LossScaleOptimizer(
+                                RMSprop(lr=learningRate, decay=decay))
         binaryLoss = 'binary_crossentropy'
         # adversarial built by passing generator output through discriminator
         adversarialModel = Sequential()
@@ -286,6 +408,76 @@ class DC_GAN(object):
         self.adversarialCompiled = adversarialModel
         return adversarialModel
 
+    def _build_train_step(self):
+        """
+        Builds a single XLA-compiled training step that updates the
+        discriminator on real and generated images and the generator through
+        the discriminator. Real images, discriminator fakes, and adversarial
+        fakes are scored in one batched discriminator pass, so both updates
+        see the same discriminator weights. Uses the optimizers of the
+        compiled discriminator and adversarial models.
+        Returns:
+            Traced function of form
+            _train_step(realImages, noiseDis, noiseAdv) -> (disLoss, disAcc,
+            advLoss, advAcc).
+        """
+        generator = self.generatorStructure
+        discriminator = self.discriminatorStructure
+        disOptimizer = self.discriminatorCompiled.optimizer
+        advOptimizer = self.adversarialCompiled.optimizer
+
+        def binary_metrics(targets, scores):
+            """ Mean binary crossentropy loss and accuracy of scores """
+            loss = tf.reduce_mean(binary_crossentropy(targets, scores))
+            acc = tf.reduce_mean(binary_accuracy(targets, scores))
+            return loss, acc
+
+        @tf.function(jit_compile=True)
+        def _train_step(realImages, noiseDis, noiseAdv):
+            realNum = tf.shape(realImages)[0]
+            fakeNum = tf.shape(noiseDis)[0]
+            fakeImages = tf.cast(generator(noiseDis, training=False),
+                                realImages.dtype)
+            disTargets = tf.concat([tf.ones((realNum, 1)),
+                                    tf.zeros((fakeNum, 1))], axis=0)
+            advTargets = tf.ones((tf.shape(noiseAdv)[0], 1))
+            disVars = discriminator.trainable_variables
+            genVars = generator.trainable_variables
+            with tf.GradientTape(persistent=True) as tape:
+                advImages = tf.cast(generator(noiseAdv, training=True),
+                                    realImages.dtype)
+                # score [real; discriminator fakes; adversarial fakes] at once
+                allScores = discriminator(tf.concat([realImages, fakeImages,
+                                                    advImages], axis=0),
+                                        training=True)
+                disScores = allScores[:(realNum + fakeNum)]
+                advScores = allScores[(realNum + fakeNum):]
+                disLoss, disAcc = binary_metrics(disTargets, disScores)
+                advLoss, advAcc = binary_metrics(advTargets, advScores)
+                disScaledLoss = disOptimizer.get_scaled_loss(disLoss)
+                advScaledLoss = advOptimizer.get_scaled_loss(advLoss)
+            # discriminator learns from valid and invalid images
+            disGrads = disOptimizer.get_unscaled_gradients(
+                                    tape.gradient(disScaledLoss, disVars))
+            # generator learns through the discriminator
+            genGrads = advOptimizer.get_unscaled_gradients(
+                                    tape.gradient(advScaledLoss, genVars))
+            del tape
+            disOptimizer.apply_gradients(zip(disGrads, disVars))
+            advOptimizer.apply_gradients(zip(genGrads, genVars))
+            return disLoss, disAcc, advLoss, advAcc
+
+        self._train_step = _train_step
+        return _train_step
+
+    def _write_h5(self, weights, outPath):
+        """
+        Writes generator weights to outPath via the skeleton generator. Runs on
+        the background saver thread so training is not blocked by disk I/O.
+        """
+        self._saverSkeleton.set_weights(weights)
+        self._saverSkeleton.save(outPath)
+
     def initialize_models(self, disLr=0.0002, disDecay=6e-8, advLr=0.0001,
                         advDecay=3e-8, verbose=True):
         """
@@ -313,8 +505,8 @@ class DC_GAN(object):
         Args:
             n (optional):       Int number of images to generate (defaults to 1)
         Returns:
-            imageTensor of shape (n, rowNum, columnNum, channelNum) generated
-            by generator given latent dim size noise vector.
+            imageTensor of shape (n, *self.imageShape) generated by generator
+            given latent dim size noise vector.
         """
         noiseVector = np.random.uniform(-1.0, 1.0, size=(n, self.LATENT_DIMS))
         imageTensor = self.generatorStructure.predict(noiseVector)
@@ -325,6 +517,8 @@ class DC_GAN(object):
         grayScale = self.channelNum == 1
         plt.figure(figsize=(10, 10))
         for imageNum, image in enumerate(imageTensor):
+            if self.channelsFirst:
+                image = image.transpose(1, 2, 0)
             plt.subplot(4, 4, i+1)
             if grayScale:
                 grayImage = image[:, :, 0]
@@ -365,13 +559,14 @@ class DC_GAN(object):
 
         for step in range(n):
             imageTensor = self.generatorStructure.predict(latentVec)
-            currentImage = imageTensor[0, :, :, 0]
+            currentImage = (imageTensor[0, 0] if self.channelsFirst
+                            else imageTensor[0, :, :, 0])
             latentVec[:] = (latentVec[0] + stepSize)
 
 
     def train_models(self, xTrain, yTrain, xVal=None, yVal=None, xTest=None,
                     yTest=None, trainSteps=2000, preSteps=5, batchSize=200,
-                    saveInterval=500, outPath=None):
+                    saveInterval=500, logInterval=50, outPath=None):
         """
         Trains discriminator, generator, and adversarial model on x- and yTrain,
         validation on x- and yVal and evaluating final metrics on x- and yTest.
@@ -380,6 +575,11 @@ class DC_GAN(object):
         Args:
             xTrain:                 Training features for discriminator to
                                         classify and generator to 'replicate'.
+                                        Image datasets may be passed in
+                                        self.imageShape or channels-last
+                                        layout; channels-last data is
+                                        transposed when the models are
+                                        channels-first.
             yTrain:                 Labels for training data.
             xVal (Optional):        Validation features to analyze training
                                         progress. Defaults to None.
@@ -399,16 +599,28 @@ class DC_GAN(object):
                                         to 200.
             saveInterval (Opt):     Intervals at which to save generator images
                                         and models. Defaults to 500.
+            logInterval (Opt):      Intervals at which to print training
+                                        metrics. Defaults to 50.
             outPath (Opt):          Path to which to save the DC_GAN object
                                         after training.
         Returns:
             Tuple of form (trainedGenerator, trainedDiscriminator,
-            trainedAversarial).
+            trainedAversarial). Per-step metrics are stored in
+            self.trainHistory.
         """
-        def shape_assertion(dataset, name):
-            """ Asserts that dataset has the proper shape """
-            assert (dataset.shape[1:]==self.imageShape), (f'{name} expected ' \
-                f'shape {self.imageShape}, but found shape {dataset.shape}.')
+        channelsLastShape = (self.rowNum, self.columnNum, self.channelNum)
+
+        def layout_assertion(dataset, name):
+            """
+            Asserts that dataset has the proper shape, transposing channels-last
+            datasets to the models' layout.
+            """
+            if (dataset.shape[1:]==self.imageShape):
+                return dataset
+            assert (dataset.shape[1:]==channelsLastShape), (f'{name} ' \
+                f'expected shape {self.imageShape} or {channelsLastShape}, ' \
+                f'but found shape {dataset.shape}.')
+            return dataset.transpose(0, 3, 1, 2)
 
         def length_assertion(dataset_1, dataset_2, name_1, name_2):
             """ Asserts that two datasets have the same example number """
@@ -417,15 +629,14 @@ class DC_GAN(object):
             assert (shape_1==shape_2), (f'{name_1} and {name_2} should have ' \
             f'the same number of examples, but have {shape_1} and {shape_2}')
 
-        datasetInputs = [('xTrain', xTrain), ('yTrain', yTrain), ('xVal', xVal),
-                        ('yVal', yVal), ('xTest', xTest), ('yTest', yTest)]
-
-        for i in range(0, len(datasetInputs), 2):
-            name_1, dataset_1 = datasetInputs[i]
-            if (dataset_1.all() != None):
-                name_2, dataset_2 = datasetInputs[i+1]
-                shape_assertion(dataset_1, name_1)
-                length_assertion(dataset_1, dataset_2, name_1, name_2)
+        xTrain = layout_assertion(xTrain, 'xTrain')
+        length_assertion(xTrain, yTrain, 'xTrain', 'yTrain')
+        if xVal is not None:
+            xVal = layout_assertion(xVal, 'xVal')
+            length_assertion(xVal, yVal, 'xVal', 'yVal')
+        if xTest is not None:
+            xTest = layout_assertion(xTest, 'xTest')
+            length_assertion(xTest, yTest, 'xTest', 'yTest')
 
         assert isinstance(trainSteps, int), ('trainSteps expected type int, ' \
                                             f'but found type ' \
@@ -439,6 +650,9 @@ class DC_GAN(object):
         assert (isinstance(saveInterval, int) or (saveInterval==None)), ('save'\
                 'Interval expected either and int or None, but found type' \
                 f'{type(saveInterval)}')
+        assert isinstance(logInterval, int), ('logInterval expected type ' \
+                                        f'int, but found {type(logInterval)}')
+        assert (logInterval > 0), 'logInterval must be positive'
         assert (isinstance(outPath, str) or (outPath==None)), ('outPath ' \
                         f'expected type str, but found type {type(outPath)}')
         assert (self.discriminatorStructure), ("Disriminator structure has " \
@@ -450,60 +664,70 @@ class DC_GAN(object):
         assert (self.adversarialCompiled), ("Adversarial model has not been " \
                         "compiled. Try running 'self.initialize_models()'.")
 
+        # hold training images contiguously in float16 to halve discriminator
+        # input traffic; matches the float16 discriminator input
+        xTrain = np.ascontiguousarray(xTrain, dtype=np.float16)
+
         # get number of examples in each dataset
         trainExampleNum = xTrain.shape[0]
-        valExampleNum = xVal.shape[0] if (xVal.all() != None) else 0
-        testExampleNum = xTest.shape[0] if (xTest.all() != None) else 0
-
-        def batch_discriminator_data(xTrain=xTrain, batchSize=batchSize):
+        valExampleNum = xVal.shape[0] if xVal is not None else 0
+        testExampleNum = xTest.shape[0] if xTest is not None else 0
+
+        # shuffled, repeating pipeline over xTrain prefetches the next batch of
+        # valid examples while the current step runs
+        trainDataset = (tf.data.Dataset.from_tensor_slices(xTrain)
+                        .shuffle(buffer_size=min(trainExampleNum, 10000))
+                        .repeat()
+                        .batch(batchSize, drop_remainder=True)
+                        .prefetch(tf.data.AUTOTUNE))
+        trainIterator = iter(trainDataset)
+
+        # preallocate discriminator batch; targets are fixed across steps
+        featuresBuf = np.empty((2 * batchSize, *self.imageShape),
+                                dtype=np.float16)
+        targetsBuf = np.empty((2 * batchSize,), dtype=np.float32)
+        targetsBuf[:batchSize] = 1.0
+        targetsBuf[batchSize:] = 0.0
+
+        def batch_discriminator_data(featuresBuf, targetsBuf,
+                                    trainIterator=trainIterator,
+                                    batchSize=batchSize):
             """
             Builds batch of data for training discriminator comprised of even
             split down batchSize. Half of output data will be a valid example
             of instance from dataset, the other half will be invalid examples
             initialized as a random-uniform noise vector of latentDims to be
-            passed to generator and discriminated after upsampling.
+            passed to generator and discriminated after upsampling. Features
+            are written in place to the preallocated featuresBuf.
             Args:
-                xTrain:         Dataset of features for training
+                featuresBuf:    Array of shape ((2 * batchSize), channelNum,
+                                    rowNum, columnNum) to fill
+                targetsBuf:     Vector of length (2 * batchSize) holding
+                                    target labels (0 - invalid, 1 - valid)
+                trainIterator:  Iterator over batches of training features
                 batchSize:      Batch size for training
             Returns:
-                4th order tensor of valid and invalid features of shape
-                ((2 * batchSize), rowNum, columnNum, channelNum) and vector of
-                target labels of length batchSize for discriminator training
-                (0 - invalid, 1 - valid) in tuple of form (features, targets).
+                Tuple of form (featuresBuf, targetsBuf).
             """
-            # select random batchSize examples from xTrain
-            selectionIndex = np.random.randint(low=0, high=trainExampleNum,
-                                                size=batchSize)
-            validExamples = xTrain[selectionIndex, :, :, :]
-            validTargets = np.ones(shape=(batchSize,))
-            # pass noise vector through generator to get noise images
-            invalidExamples = self.generate_images(batchSize)
-            invalidTargets = np.zeros(shape=(batchSize,))
-            # concatenate features and targets and return
-            features = np.concatenate([validExamples, invalidExamples])
-            targets = np.concatenate([validTargets, invalidTargets])
-            return features, targets
-
-        def batch_adversarial_data(batchSize=batchSize):
-            """
-            Generates batch of training data for adversarial network. Here,
-            every example is a random vector of length latentDims and every
-            label is valid (1). The goal of the generator within the adversarial
-            model is to create an output from the noise vector who's 'validity
-            score' has minimum binary crossentropy loss with respect to 1.0
-            as output by the discriminator within the adversarial model.
-            Args:
-                batchSize:      Batch size for training
-            Returns:
-                2nd order tensor of shape (batchSize, latentDims) containing
-                noise vectors for initializing the generator and vector of
-                target labels (all 1's - valid) in tuple of form (features,
-                targets).
-            """
-            noiseLatent = np.random.uniform(low=-1.0, high=1.0,
-                                            size=(batchSize, self.LATENT_DIMS))
-            targets = np.ones(shape=(batchSize,))
-            return (noiseLatent, targets)
+            # take next batchSize examples from xTrain
+            featuresBuf[:batchSize] = next(trainIterator).numpy()
+            # pass noise vector through folded generator to get noise images
+            noiseLatent = tf.random.uniform((batchSize, self.LATENT_DIMS),
+                                            -1.0, 1.0)
+            featuresBuf[batchSize:] = self._gen_fn(noiseLatent).numpy()
+            return featuresBuf, targetsBuf
+
+        if not self._train_step:
+            self._build_train_step()
+        # single worker serializes checkpoint writes off the training thread
+        if not self._saver:
+            self._saver = ThreadPoolExecutor(max_workers=1)
+            self._saverSkeleton = clone_model(self.generatorStructure)
+        saveFutures = []
+        # per-step (disLoss, disAcc, advLoss, advAcc); step metrics are kept
+        # as tensors until a log tick so the host does not sync every step
+        self.trainHistory = np.zeros((trainSteps, 4), dtype=np.float32)
+        pendingMetrics = []
 
         print(f'Training for {trainSteps} steps on {trainExampleNum} ' \
             f'examples with batch size of {batchSize}.\nValidating on ' \
@@ -512,8 +736,14 @@ class DC_GAN(object):
         # pretrain discriminator
         if preSteps:
             assert (preSteps > 0), 'preSteps must be a positive int.'
+            # generator is fixed during pretraining, so one fold serves every
+            # pretraining step
+            if not self._generatorInference:
+                self._build_folded_generator()
+            self._fold_generator_weights()
             for preStep in range(preSteps):
-                preFeatures, preTargets = batch_discriminator_data()
+                preFeatures, preTargets = batch_discriminator_data(featuresBuf,
+                                                                   targetsBuf)
                 preData = self.discriminatorCompiled.train_on_batch(x=preFeatures,
                                                                     y=preTargets)
                 valData = [0,0]
@@ -524,33 +754,46 @@ class DC_GAN(object):
                     f'val loss: {valLoss} val acc: {valAcc}')
 
         for curStep in range(trainSteps):
-            # train discriminator on valid and invalid images
-            disFeatures, disTargets = batch_discriminator_data()
-            disData = self.discriminatorCompiled.train_on_batch(x=disFeatures,
-                                                                y=disTargets)
-            # train adversarial network
-            advFeatures, advTargets = batch_adversarial_data()
-            advData = self.adversarialCompiled.train_on_batch(x=advFeatures,
-                                                            y=advTargets)
-            # validate, format, and log
-            # if (valExampleNum > 0):
-            #     valData = self.discriminatorCompiled.evaluate(x=xVal, y=yVal,
-            #                                                     verbose=False)
-            valData = [0,0]
-            disLoss, disAcc = round(disData[0], 3), round(disData[1], 3)
-            valLoss, valAcc = round(valData[0], 3), round(valData[1], 3)
-            advLoss, advAcc = round(advData[0], 3), round(advData[1], 3)
-            print(f'Step: {curStep}\n' \
-                f'\tD [train loss: {disLoss} train acc: {disAcc} | ' \
-                f'val loss: {valLoss} val acc: {valAcc}]\n' \
-                f'\tA [loss: {advLoss} acc: {advAcc}]')
+            # train discriminator and adversarial network in a single step
+            realImages = next(trainIterator)
+            # noise for discriminator fakes and for the adversarial update;
+            # adversarial targets (all valid) are built inside the step
+            noiseDis = tf.random.uniform((batchSize, self.LATENT_DIMS),
+                                        -1.0, 1.0)
+            noiseAdv = tf.random.uniform((batchSize, self.LATENT_DIMS),
+                                        -1.0, 1.0)
+            stepData = self._train_step(realImages, noiseDis, noiseAdv)
+            pendingMetrics.append(stepData)
+            # validate, format, and log at logInterval benchmarks
+            if (((curStep % logInterval) == 0) or (curStep == trainSteps - 1)):
+                # fetch all pending steps in a single device-to-host copy
+                firstPending = curStep + 1 - len(pendingMetrics)
+                self.trainHistory[firstPending:(curStep + 1)] = tf.stack(
+                                                    pendingMetrics).numpy()
+                pendingMetrics = []
+                # if (valExampleNum > 0):
+                #     valData = self.discriminatorCompiled.evaluate(x=xVal,
+                #                                   y=yVal, verbose=False)
+                valData = [0,0]
+                disLoss, disAcc, advLoss, advAcc = (self.trainHistory[curStep]
+                                                    .round(3))
+                valLoss, valAcc = round(valData[0], 3), round(valData[1], 3)
+                print(f'Step: {curStep}\n' \
+                    f'\tD [train loss: {disLoss} train acc: {disAcc} | ' \
+                    f'val loss: {valLoss} val acc: {valAcc}]\n' \
+                    f'\tA [loss: {advLoss} acc: {advAcc}]')
             # save at saveInterval benchmarks
             if (((curStep % saveInterval) == 0) and (curStep != 0)):
                 self.generate_and_plot(n=10, name=curStep, show=False,
                                         outPath=f'training_data3/{curStep}')
                 plt.close()
-                self.generatorStructure.save('training_data/' \
-                                            f'generatorModel_{curStep}.h5')
+                weights = self.generatorStructure.get_weights()
+                saveFutures.append(self._saver.submit(self._write_h5, weights,
+                            f'training_data/generatorModel_{curStep}.h5'))
+
+        # wait for pending checkpoints, surfacing any write errors
+        for saveFuture in saveFutures:
+            saveFuture.result()
 
         # when training is complete, test on witheld data and save
         if (testExampleNum > 0):